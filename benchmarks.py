@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Nothing on the --help path may import these
+LAZY_MODULES = ['requests', 'bs4', 'selenium', 'dotenv']
+
+def build_script_heavy_page(blocks=40):
+    # Roughly what a bundled SPA looks like: large inline scripts, styles,
+    # icon sprites and hydration blobs around a modest amount of real content.
+    bundle = 'var a=' + json.dumps(['x' * 80] * 400) + ';'
+    style = '.c{color:#333;margin:0 auto;padding:4px}' * 600
+    icon = '<svg viewBox="0 0 24 24">' + '<path d="' + 'M12 2L2 7l10 5 10-5-10-5z' * 40 + '"/>' * 20 + '</svg>'
+    ld_json = json.dumps({
+        '@type': 'Organization',
+        'keywords': ['analytics', 'dashboards', 'reporting'],
+        'description': 'Self-serve analytics for growing teams'
+    })
+
+    parts = [
+        '<html><head><title>Acme Analytics - Dashboards for Teams</title>',
+        '<meta name="keywords" content="analytics, dashboards, metrics">',
+        '<meta name="description" content="Build dashboards your whole team understands">',
+        f'<script type="application/ld+json">{ld_json}</script>',
+        f'<style>{style}</style>',
+        f'<script>{bundle}</script>',
+        '</head><body>',
+        '<header><nav><a class="btn btn-primary" href="/signup">Sign<!-- -->Up</a>',
+        f'<button class="cta">{icon}Get Started</button></nav></header>',
+        '<main>'
+    ]
+    for i in range(blocks):
+        parts.append(
+            f'<article class="blog-post"><h2>Post {i}: <strong>Reporting</strong> tips</h2>'
+            f'<a href="/blog/{i}">Read</a><p class="excerpt">Excerpt for post {i}</p>{icon}'
+            f'<script>window.__DATA_{i}__={bundle}</script></article>'
+        )
+    parts.append(
+        '<section class="pricing"><div class="product">Pro</div>'
+        '<a class="try-link" href="https://example.com/trial">Try Now</a></section>'
+        '</main><footer><a href="https://twitter.com/acme">Contact Us</a></footer>'
+        f'<script>{bundle}</script></body></html>'
+    )
+    return ''.join(parts)
+
+# Small pages with markup that a naive stripper gets wrong. Each one must give
+# the same analyzer output with and without selective parsing.
+EQUIVALENCE_CASES = {
+    'commented-out script': (
+        '<html><head><title>Pricing Plans</title></head><body><!-- <script> old tracker -->'
+        '<main><h1>Pricing plans</h1><a class="btn" href="/signup">Sign Up</a></main>'
+        '<script>var later = 1;</script></body></html>'
+    ),
+    'script in attribute value': (
+        '<html><head><title>Pricing Plans</title></head><body><div data-tpl="<script>">'
+        '<h1>Pricing plans</h1><a class="btn" href="/signup">Sign Up</a></div>'
+        '<script>var later = 1;</script></body></html>'
+    ),
+    'text split by comments and scripts': (
+        '<html><body><header><button class="btn">Sign<!-- -->Up</button>'
+        '<a role="button">Go <script>var s = "Sign Up";</script> now</a></header></body></html>'
+    ),
+    'svg with text': (
+        '<html><body><button class="cta"><svg><title>Arrow icon</title><path d="M0"></path>'
+        '<path d="M1"/><path d="M2"><title>Tip</title></path></svg>Try Now</button>'
+        '<style>.a > .b { color: red }</style></body></html>'
+    ),
+    'self-closing script': (
+        '<html><head><script src="a.js"/><style/></head><body><main><h1>Pricing plans</h1>'
+        '<a class="btn" href="/signup">Sign Up</a></main><script>var x=1;</script></body></html>'
+    ),
+    'icon link with svg title': (
+        '<html><body><a href="/s"><svg><title>Sign Up</title><path d="M0"/></svg></a>'
+        '<a href="/t"><svg><title>Try Now</title><path d="M1"> </path></svg></a></body></html>'
+    ),
+    'json-ld kept': (
+        '<html><head><SCRIPT src="a.js"></SCRIPT>'
+        '<script type="application/ld+json">{"keywords": "foo,barbaz"}</script></head>'
+        '<body><h2>Hello <b>World</b></h2></body></html>'
+    )
+}
+
+def measure_parse(analyzer, html, rounds):
+    tracemalloc.start()
+    soup = analyzer.make_soup(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        analyzer.make_soup(html)
+    elapsed = (time.perf_counter() - start) / rounds
+    return soup, elapsed, peak
+
+def analyzer_outputs(analyzer, soup):
+    return {
+        'keywords': sorted(analyzer.keywords_from_soup(soup)),
+        'audit': analyzer.audit_from_soup(soup, 'https://example.com'),
+        'cta': analyzer.cta_from_soup(soup)
+    }
+
+def bench_parse(args):
+    import logging
+    from web_research import WebAnalyzer
+
+    # The tiny equivalence pages trip the audit's "limited content" warnings
+    logging.getLogger("web_analyzer").setLevel(logging.ERROR)
+
+    html = build_script_heavy_page(args.blocks)
+    full = WebAnalyzer(selective_parse=False)
+    selective = WebAnalyzer(selective_parse=True)
+
+    full_soup, full_time, full_peak = measure_parse(full, html, args.rounds)
+    selective_soup, selective_time, selective_peak = measure_parse(selective, html, args.rounds)
+
+    print(f"Page size: {len(html) / 1024:.0f} KiB")
+    print(f"{'mode':<10} {'parse ms':>10} {'peak KiB':>10}")
+    print(f"{'full':<10} {full_time * 1000:>10.1f} {full_peak / 1024:>10.0f}")
+    print(f"{'selective':<10} {selective_time * 1000:>10.1f} {selective_peak / 1024:>10.0f}")
+    print(f"Parse time saved: {1 - selective_time / full_time:.0%}, peak memory saved: {1 - selective_peak / full_peak:.0%}")
+
+    # The stripped tree has to produce exactly what the full tree does
+    pages = [('benchmark page', full_soup, selective_soup)]
+    for case, case_html in EQUIVALENCE_CASES.items():
+        pages.append((case, full.make_soup(case_html), selective.make_soup(case_html)))
+
+    failed = False
+    for case, case_full_soup, case_selective_soup in pages:
+        full_outputs = analyzer_outputs(full, case_full_soup)
+        selective_outputs = analyzer_outputs(selective, case_selective_soup)
+        for name in full_outputs:
+            if full_outputs[name] != selective_outputs[name]:
+                print(f"MISMATCH in {name} output for {case}:")
+                print(f"  full:      {full_outputs[name]}")
+                print(f"  selective: {selective_outputs[name]}")
+                failed = True
+    if failed:
+        return 1
+    print(f"Keyword, audit and CTA output identical in both modes ({len(pages)} pages)")
+    return 0
+
+def parse_importtime(stderr):
+    # Returns [(module, self_us, cumulative_us, depth)] from -X importtime output
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+def script_imports(imports):
+    # Drop what the interpreter imports before running the script (site and
+    # everything it pulls in), which depends on the environment, not on us
+    top_level = [i for i, entry in enumerate(imports) if entry[3] == 0 and entry[0] == 'site']
+    return imports[top_level[-1] + 1:] if top_level else imports
+
+def run_startup(args_list):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.join(ROOT, 'main.py')] + args_list,
+        capture_output=True, text=True, cwd=ROOT
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py {' '.join(args_list)} exited with {result.returncode}: {result.stderr[-500:]}")
+    return wall, script_imports(parse_importtime(result.stderr))
+
+def bench_startup(args):
+    walls = []
+    import_totals = []
+    imports = []
+    for _ in range(args.rounds):
+        wall, imports = run_startup(['--help'])
+        walls.append(wall)
+        import_totals.append(sum(entry[2] for entry in imports if entry[3] == 0) / 1000)
+
+    wall_ms = statistics.median(walls) * 1000
+    import_ms = statistics.median(import_totals)
+    print(f"main.py --help: {wall_ms:.1f} ms wall, {import_ms:.1f} ms importing (median of {args.rounds})")
+    print("Slowest top-level imports:")
+    for name, _, cumulative_us, _ in sorted((e for e in imports if e[3] == 0), key=lambda e: -e[2])[:args.top]:
+        print(f"  {name:<30} {cumulative_us / 1000:>8.1f} ms")
+
+    failed = False
+    imported = {entry[0].split('.')[0] for entry in imports}
+    leaked = [name for name in LAZY_MODULES if name in imported]
+    if leaked:
+        print(f"FAIL: --help imported {', '.join(leaked)}")
+        failed = True
+
+    # The HTTP-only path must work without ever importing selenium
+    probe = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, web_research; web_research.WebAnalyzer(use_browser=False).render_page("https://example.com", "cta"); '
+         'sys.exit("selenium" in sys.modules)'],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if probe.returncode != 0:
+        print(f"FAIL: --no-browser path imported selenium or crashed: {probe.stderr[-500:]}")
+        failed = True
+
+    if import_ms > args.budget_ms:
+        print(f"FAIL: import time {import_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+
+    if not failed:
+        print(f"OK: within the {args.budget_ms:.0f} ms import budget, no heavy modules on the --help path")
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Web Analyzer benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parse_parser = subparsers.add_parser("parse", help="Full vs selective parsing on a script-heavy page")
+    parse_parser.add_argument("--blocks", type=int, default=40, help="Number of content blocks in the synthetic page")
+    parse_parser.add_argument("--rounds", type=int, default=10, help="Parses per mode for the timing average")
+    parse_parser.set_defaults(func=bench_parse)
+
+    startup_parser = subparsers.add_parser("startup", help="CLI start-up cost measured with -X importtime")
+    startup_parser.add_argument("--rounds", type=int, default=5, help="Interpreter launches to take the median over")
+    startup_parser.add_argument("--budget-ms", type=float, default=50,
+                                help="Fail if main.py's own imports take longer than this")
+    startup_parser.add_argument("--top", type=int, default=8, help="How many of the slowest imports to list")
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
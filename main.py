@@ -1,23 +1,54 @@
 import sys
 import argparse
-from dotenv import load_dotenv
 
-from web_research import WebAnalyzer
-from utils import setup_logging, clean_url
+# Heavy dependencies (requests, bs4, selenium, dotenv) are imported lazily;
+# importing web_research itself only pulls in the standard library.
+from web_research import WebAnalyzer, SEARCH_PROVIDERS
+from utils import setup_logging, clean_url, NDJSONReportWriter, DebugCapture
 
 def main():
-    # Set up logging
-    logger = setup_logging()
-    
-    # Load environment variables
-    load_dotenv()
-    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Competitive Web Research Tool")
     parser.add_argument("url", nargs="?", help="URL of competitor website to analyze")
     parser.add_argument("--output", "-o", help="Output file name prefix")
+    parser.add_argument("--ndjson", help="Append the report as one line to this NDJSON file (rotated and shared across workers)")
+    parser.add_argument("--ndjson-max-mb", type=int, default=50, help="Rotate the NDJSON file once it exceeds this size")
+    parser.add_argument("--no-compress", action="store_true", help="Keep rotated NDJSON segments uncompressed")
+    parser.add_argument("--fsync", choices=NDJSONReportWriter.FSYNC_POLICIES, default="interval",
+                        help="When to fsync NDJSON appends")
+    parser.add_argument("--max-body-mb", type=float, default=5, help="Stop reading a page after this many bytes off the wire")
+    parser.add_argument("--max-decoded-mb", type=float, default=20, help="Stop decompressing a page after this many bytes")
+    parser.add_argument("--providers", default=",".join(SEARCH_PROVIDERS),
+                        help=f"Comma-separated search providers to query concurrently ({', '.join(SEARCH_PROVIDERS)})")
+    parser.add_argument("--debug-capture-rate", type=float, default=0.0,
+                        help="Fraction of search responses to save for debugging (0 disables capture)")
+    parser.add_argument("--debug-capture-dir", help="Directory for captured search responses")
+    parser.add_argument("--debug-capture-max-files", type=int, default=50, help="Keep at most this many captures")
+    parser.add_argument("--no-browser", action="store_true",
+                        help="Fetch pages over plain HTTP only; never start (or import) selenium")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Minimum level of diagnostics to log")
+    parser.add_argument("--log-json", action="store_true", help="Write log records as JSON lines")
+    parser.add_argument("--snapshots", action="store_true",
+                        help="Keep every analyzed page body in the content-addressed snapshot store")
+    parser.add_argument("--snapshot-dir", help="Snapshot store directory")
+    parser.add_argument("--snapshot-max-mb", type=float, default=500,
+                        help="Trim least recently used snapshots once the store exceeds this size")
+    parser.add_argument("--full-parse", action="store_true", help="Parse pages with scripts, styles and SVG paths left in")
     args = parser.parse_args()
     
+    providers = [name.strip() for name in args.providers.split(",") if name.strip()]
+    unknown = [name for name in providers if name not in SEARCH_PROVIDERS]
+    if unknown or not providers:
+        parser.error(f"Unknown search provider(s): {', '.join(unknown) or 'none given'}")
+    
+    # Set up logging
+    logger = setup_logging(level=args.log_level, json_format=args.log_json)
+    
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    
     # If no URL provided via command line, prompt the user
     url = args.url
     if not url:
@@ -26,20 +57,65 @@ def main():
     # Clean URL
     url = clean_url(url)
     
-    logger.info(f"Starting analysis for: {url}")
+    logger.info("Starting analysis for: %s", url)
     
+    report_writer = None
+    if args.ndjson:
+        report_writer = NDJSONReportWriter(
+            args.ndjson,
+            max_bytes=args.ndjson_max_mb * 1024 * 1024,
+            compress=not args.no_compress,
+            fsync=args.fsync
+        )
+
+    debug_capture = None
+    if args.debug_capture_rate > 0:
+        debug_capture = DebugCapture(
+            directory=args.debug_capture_dir,
+            sample_rate=args.debug_capture_rate,
+            max_files=args.debug_capture_max_files
+        )
+
+    snapshot_store = None
+    if args.snapshots:
+        from snapshot_store import SnapshotStore
+        snapshot_store = SnapshotStore(
+            directory=args.snapshot_dir,
+            max_bytes=int(args.snapshot_max_mb * 1024 * 1024)
+        )
+
+    researcher = None
     try:
         # Initialize and run the analysis
-        researcher = WebAnalyzer()
+        researcher = WebAnalyzer(
+            report_writer=report_writer,
+            max_body_bytes=int(args.max_body_mb * 1024 * 1024),
+            max_decoded_bytes=int(args.max_decoded_mb * 1024 * 1024),
+            selective_parse=not args.full_parse,
+            search_providers=providers,
+            debug_capture=debug_capture,
+            use_browser=not args.no_browser,
+            snapshot_store=snapshot_store
+        )
         report = researcher.generate_report(url)
         
-        logger.info(f"Analysis complete. Report saved.")
+        if snapshot_store:
+            # Never collect what this report just referenced
+            snapshot_store.gc(keep=[s['hash'] for s in report['data'].get('snapshots', [])])
+        
+        logger.info("Analysis complete. Report saved.")
         print(f"\nAnalysis complete! Check the generated JSON file for details.")
         
     except Exception as e:
-        logger.error(f"Error during analysis: {str(e)}")
-        print(f"Error during analysis: {str(e)}")
+        logger.error("Error during analysis: %s", e)
         sys.exit(1)
+    finally:
+        if researcher:
+            researcher.close()
+        if report_writer:
+            report_writer.close()
+        if debug_capture:
+            debug_capture.close()
 
 if __name__ == "__main__":
     main()
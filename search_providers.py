@@ -1,10 +1,248 @@
+import os
+import json
+import logging
 import random
 import time
-import requests
-from bs4 import BeautifulSoup
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: breaker file writes are still atomic, just not serialised
+    fcntl = None
+
+logger = logging.getLogger("web_analyzer.search")
+
+# requests, bs4, concurrent.futures and email.utils are imported on first use
+# to keep CLI start-up cheap
+
+class ProviderUnavailable(Exception):
+    # Raised instead of sending a request while a provider's circuit is open
+    pass
+
+class ProviderBlocked(Exception):
+    # The provider answered with a rate-limit, block or CAPTCHA page
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ProviderHealth:
+    # Circuit breaker for one search provider. Consecutive failures (or a single
+    # block/CAPTCHA page) open the circuit; while open every search fails fast
+    # until the cool-down ends, then one half-open probe decides whether to
+    # close it again or re-open with a longer cool-down. One instance per
+    # provider name is shared by every thread in the process, and trips are
+    # published to a JSON file under .cache/ so separate worker processes
+    # (batch runs start one main.py per URL) fail fast too instead of each
+    # rediscovering the block.
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name, failure_threshold=3, cooldown=60.0, max_cooldown=900.0, state_path=None):
+        if state_path is None:
+            state_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "provider_health.json")
+        self.name = name
+        self.state_path = state_path
+        self._state_mtime = None
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.last_error = None
+        self.stats = {
+            'requests': 0,
+            'successes': 0,
+            'failures': 0,
+            'blocks': 0,
+            'trips': 0,
+            'short_circuited': 0
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_provider(cls, name):
+        with cls._registry_lock:
+            if name not in cls._registry:
+                cls._registry[name] = cls(name)
+            return cls._registry[name]
+
+    @contextmanager
+    def _shared_state_lock(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        lock_fd = os.open(self.state_path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def _read_shared_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _sync_from_shared_state(self):
+        # Adopt a trip another process published. Only re-read when the file changed.
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._state_mtime:
+            return
+        self._state_mtime = mtime
+
+        entry = self._read_shared_state().get(self.name)
+        if entry and entry.get('open_until', 0) > max(time.time(), self.open_until):
+            self.state = self.OPEN
+            self.open_until = entry['open_until']
+            self.cooldown = max(self.cooldown, entry.get('cooldown', self.cooldown))
+            self.last_error = entry.get('last_error', self.last_error)
+            self.probe_in_flight = False
+
+    def _publish_shared_state(self, tripped):
+        # Record our trip, or clear a stale one once we have closed again
+        try:
+            with self._shared_state_lock():
+                shared = self._read_shared_state()
+                if tripped:
+                    shared[self.name] = {
+                        'open_until': self.open_until,
+                        'cooldown': self.cooldown,
+                        'last_error': self.last_error
+                    }
+                else:
+                    entry = shared.get(self.name)
+                    # Keep a trip another process made after our probe started
+                    if entry is None or entry.get('open_until', 0) > time.time():
+                        return
+                    del shared[self.name]
+                tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(shared, f)
+                os.replace(tmp_path, self.state_path)
+                # Our own write needs no re-read
+                self._state_mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError as e:
+            logger.warning("Could not share %s breaker state: %s", self.name, e)
+
+    def before_request(self):
+        with self._lock:
+            self._sync_from_shared_state()
+            now = time.time()
+            if self.state == self.OPEN:
+                if now < self.open_until:
+                    self.stats['short_circuited'] += 1
+                    raise ProviderUnavailable(
+                        f"{self.name} circuit open for another {self.open_until - now:.0f}s")
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # Only one probe at a time; everyone else keeps failing fast
+                if self.probe_in_flight:
+                    self.stats['short_circuited'] += 1
+                    raise ProviderUnavailable(f"{self.name} circuit half-open, probe in flight")
+                self.probe_in_flight = True
+
+            self.stats['requests'] += 1
+
+    def record_success(self):
+        with self._lock:
+            self.stats['successes'] += 1
+            self.consecutive_failures = 0
+            reopened = self.state != self.CLOSED
+            if reopened:
+                logger.info("%s circuit closed", self.name)
+            self.state = self.CLOSED
+            self.cooldown = self.base_cooldown
+            self.probe_in_flight = False
+            if reopened:
+                self._publish_shared_state(tripped=False)
+
+    def release(self):
+        # The request was abandoned (search cancelled), not answered: free the
+        # half-open probe slot without counting it either way
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_failure(self, error, blocked=False, retry_after=None):
+        with self._lock:
+            self.last_error = str(error)
+            self.stats['failures'] += 1
+            if blocked:
+                self.stats['blocks'] += 1
+            self.consecutive_failures += 1
+
+            if blocked or self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                # A failed probe backs off harder than the previous cool-down
+                if self.state == self.HALF_OPEN:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                cooldown = max(self.cooldown, retry_after or 0)
+                self.state = self.OPEN
+                self.open_until = time.time() + cooldown
+                self.probe_in_flight = False
+                self.stats['trips'] += 1
+                logger.warning("%s circuit open for %.0fs: %s", self.name, cooldown, self.last_error)
+                self._publish_shared_state(tripped=True)
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics['state'] = self.state
+            metrics['consecutive_failures'] = self.consecutive_failures
+            metrics['last_error'] = self.last_error
+            if self.state == self.OPEN:
+                metrics['open_for_seconds'] = round(max(self.open_until - time.time(), 0), 1)
+            return metrics
+
+def parse_retry_after(value):
+    from email.utils import parsedate_to_datetime
+
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
 
 class SearchProvider:
-    def __init__(self):
+    # Status codes worth retrying after a pause; anything else 4xx is a hard failure
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+    # Lower-cased markers of block and CAPTCHA interstitials. Real result pages
+    # can contain them too (a snippet about CAPTCHAs, a reCAPTCHA script), so
+    # they are only checked when a page parsed to no result containers.
+    BLOCK_MARKERS = ['g-recaptcha', 'h-captcha', 'cf-challenge', 'are you a robot', 'unusual traffic']
+    # (min, max) seconds a provider deliberately waits before each request
+    PACING_DELAY = (0, 0)
+
+    def __init__(self, max_backoff=30.0, debug_capture=None):
+        self.health = ProviderHealth.for_provider(self.__class__.__name__)
+        self.max_backoff = max_backoff
+        # Set by MultiProviderSearch.close() to cut pacing and backoff sleeps short
+        self.cancel_event = threading.Event()
+        # Optional utils.DebugCapture; off unless the caller opts in
+        self.debug_capture = debug_capture
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/91.0.864.48 Safari/537.36',
@@ -26,144 +264,538 @@ class SearchProvider:
     def search(self, query, max_results=10, max_retries=3):
         pass
 
+    def check_response(self, response):
+        # Turn rate limits and block redirects into ProviderBlocked before parsing
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if response.status_code == 429:
+            raise ProviderBlocked(f"{self.__class__.__name__} rate limited (429)", retry_after)
+        if '/sorry/' in response.url:
+            raise ProviderBlocked(f"{self.__class__.__name__} redirected to block page", retry_after)
+        if response.status_code == 503 and retry_after is not None:
+            raise ProviderBlocked(f"{self.__class__.__name__} unavailable (503)", retry_after)
+        response.raise_for_status()
+
+    def check_block_page(self, response):
+        # Called when a page has no result containers: tell a CAPTCHA/block
+        # interstitial apart from a genuine "no results" page.
+        # Block pages are small; only sniff the start of the body
+        head = response.text[:20000].lower()
+        if any(marker in head for marker in self.BLOCK_MARKERS):
+            raise ProviderBlocked(f"{self.__class__.__name__} returned a CAPTCHA/block page",
+                                  parse_retry_after(response.headers.get('Retry-After')))
+
+    def capture_response(self, query, response):
+        if self.debug_capture:
+            # Deferred: response.text decodes the whole body, which unsampled queries skip
+            self.debug_capture.capture(f"{self.__class__.__name__}_{query}", lambda: response.text, lambda: {
+                'status': response.status_code,
+                'url': response.url,
+                'headers': dict(response.headers)
+            })
+
+    def wait(self, seconds):
+        if self.cancel_event.wait(seconds):
+            raise ProviderUnavailable(f"{self.__class__.__name__} search cancelled")
+
+    def pace(self):
+        low, high = self.PACING_DELAY
+        if high:
+            self.wait(random.uniform(low, high))
+
+    def backoff_delay(self, attempt, base_delay):
+        # Exponential backoff with full jitter, capped
+        return random.uniform(0, min(base_delay * (2 ** attempt), self.max_backoff))
+
+    def run_with_retries(self, query, max_retries, base_delay, attempt_search):
+        import requests
+
+        # Shared retry loop: consult the circuit breaker before every attempt,
+        # stop at the first block page, and only retry errors worth retrying.
+        for attempt in range(max_retries):
+            self.health.before_request()
+            try:
+                results = attempt_search()
+            except ProviderBlocked as e:
+                self.health.record_failure(e, blocked=True, retry_after=e.retry_after)
+                raise
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                self.health.record_failure(e)
+                if status not in self.RETRYABLE_STATUS:
+                    raise
+                error = e
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+            except (requests.RequestException, ValueError) as e:
+                self.health.record_failure(e)
+                error = e
+                retry_after = None
+            except ProviderUnavailable:
+                # Cancelled by MultiProviderSearch.close(); says nothing about the provider
+                self.health.release()
+                raise
+            except Exception as e:
+                # Anything else (e.g. a parser KeyError) still has to settle the
+                # breaker, or a half-open probe would stay "in flight" forever
+                self.health.record_failure(e)
+                raise
+            else:
+                self.health.record_success()
+                if results:
+                    return results
+                # A well-formed page with no results is not a provider failure
+                return []
+
+            logger.warning("%s attempt %d for '%s' failed: %s", self.__class__.__name__, attempt + 1, query, error)
+            if attempt < max_retries - 1:
+                if retry_after is not None and retry_after > self.max_backoff:
+                    # Not worth waiting inside this query; let the caller move on
+                    raise error
+                self.wait(max(self.backoff_delay(attempt, base_delay), retry_after or 0))
+
+        raise error
+
+class GoogleSession:
+    # Owns the requests sessions used for Google. The homepage is fetched once to
+    # pick up consent/NID cookies, the cookies are saved to disk so later runs
+    # skip the warm-up entirely, and the session is only re-warmed when a
+    # response shows it has expired (consent redirect or expired cookies).
+    # requests.Session is not thread-safe and a request abandoned by
+    # MultiProviderSearch can still be running when the next keyword starts,
+    # so every thread gets its own session; they all share one cookie jar,
+    # which locks internally.
+    HOME_URL = 'https://www.google.com/'
+    REQUIRED_COOKIES = ('NID', 'AEC')
+
+    def __init__(self, cookie_path=None, max_age=12 * 3600):
+        if cookie_path is None:
+            cookie_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "google_cookies.json")
+        import requests
+
+        self.cookie_path = cookie_path
+        self.max_age = max_age
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self._local = threading.local()
+        self.warmed_at = None
+        # Whether the warm-up actually produced NID/AEC; only then can they "expire"
+        self.has_session_cookies = False
+        self.warm_failed_at = None
+        self.warm_retry_after = 60.0
+        self._lock = threading.Lock()
+        self._load_cookies()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            session.cookies = self.cookies
+            self._local.session = session
+        return session
+
+    def _load_cookies(self):
+        try:
+            with open(self.cookie_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if time.time() - saved.get('saved_at', 0) > self.max_age:
+            return
+        for cookie in saved.get('cookies', []):
+            self.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/'),
+                expires=cookie.get('expires'), secure=cookie.get('secure', False)
+            )
+        if not self.cookies_expired():
+            self.warmed_at = saved['saved_at']
+            self.has_session_cookies = True
+
+    def _save_cookies(self):
+        cookies = [{
+            'name': c.name,
+            'value': c.value,
+            'domain': c.domain,
+            'path': c.path,
+            'expires': c.expires,
+            'secure': c.secure
+        } for c in self.cookies]
+        os.makedirs(os.path.dirname(self.cookie_path), exist_ok=True)
+        tmp_path = f"{self.cookie_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': self.warmed_at, 'cookies': cookies}, f)
+            os.replace(tmp_path, self.cookie_path)
+        except OSError as e:
+            logger.warning("Could not persist Google cookies: %s", e)
+
+    def cookies_expired(self):
+        now = time.time()
+        names = set()
+        for cookie in self.cookies:
+            if cookie.domain.endswith('google.com') and not (cookie.expires and cookie.expires < now):
+                names.add(cookie.name)
+        return not any(name in names for name in self.REQUIRED_COOKIES)
+
+    def ensure_warm(self, headers):
+        import requests
+
+        with self._lock:
+            now = time.time()
+            if self.warmed_at is not None and now - self.warmed_at < self.max_age:
+                return
+            if self.warm_failed_at is not None and now - self.warm_failed_at < self.warm_retry_after:
+                return
+            try:
+                response = self.session.get(self.HOME_URL, headers=headers, timeout=10)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                # Searching without the warm-up cookies still works, just less reliably
+                logger.warning("Failed to warm Google session: %s", e)
+                self.warm_failed_at = now
+                return
+            self.warmed_at = time.time()
+            self.warm_failed_at = None
+            self.has_session_cookies = not self.cookies_expired()
+            self._save_cookies()
+            time.sleep(random.uniform(1, 3))
+
+    def looks_expired(self, response):
+        if 'consent.google.' in response.url:
+            return True
+        return self.has_session_cookies and self.cookies_expired()
+
+    def invalidate(self):
+        with self._lock:
+            self.warmed_at = None
+            self.has_session_cookies = False
+            self.cookies.clear()
+
 class GoogleSearch(SearchProvider):
-    def __init__(self):
-        super().__init__()
-        self.session = requests.Session()
+    PACING_DELAY = (2, 5)
+
+    def __init__(self, debug_capture=None, google_session=None):
+        super().__init__(debug_capture=debug_capture)
+        self.google_session = google_session or GoogleSession()
+
+    @property
+    def session(self):
+        # The calling thread's session
+        return self.google_session.session
         
     def search(self, query, max_results=10, max_retries=3):
+        from bs4 import BeautifulSoup
+
         if not query or len(query.strip()) < 3:
-            print(f"Query too short or invalid: {query}")
+            logger.debug("Query too short or invalid: %s", query)
             return []
             
-        results = []
-        retry_delay = 2
-        print(f"Searching for: {query}")
+        logger.debug("Searching Google for: %s", query)
 
-        for attempt in range(max_retries):
-            try:
-                params = {
-                    'q': query,
-                    'num': max_results,
-                    'hl': 'en'
-                }
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1'
-                }
-                # Add random delay between requests
-                time.sleep(random.uniform(2, 5))
-                
-                # Rotate user agent
-                headers['User-Agent'] = random.choice(self.user_agents)
-                
-                # First get the homepage to set cookies
-                try:
-                    home_response = self.session.get('https://www.google.com/', headers=headers, timeout=10)
-                    home_response.raise_for_status()
-                    time.sleep(random.uniform(1, 3))
-                except Exception as e:
-                    print(f"[DEBUG] Failed to get homepage: {str(e)}")
-                
-                # Now perform the search
+        def attempt_search():
+            results = []
+            params = {
+                'q': query,
+                'num': max_results,
+                'hl': 'en'
+            }
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'DNT': '1',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1'
+            }
+            # Add random delay between requests
+            self.pace()
+            
+            # Rotate user agent
+            headers['User-Agent'] = random.choice(self.user_agents)
+            
+            # Cookies come from a one-off warm-up (or from disk), not a homepage hit per query
+            self.google_session.ensure_warm(headers)
+            
+            # Now perform the search
+            response = self.session.get(
+                'https://www.google.com/search',
+                headers=headers,
+                params=params,
+                timeout=10
+            )
+            if self.google_session.looks_expired(response):
+                # Session went stale: re-warm once and repeat the query
+                self.google_session.invalidate()
+                self.google_session.ensure_warm(headers)
                 response = self.session.get(
                     'https://www.google.com/search',
                     headers=headers,
                     params=params,
                     timeout=10
                 )
-                response.raise_for_status()
-                
-                print(f"[DEBUG] Response status: {response.status_code}")
-                print("[DEBUG] Response URL:", response.url)
-                print("[DEBUG] Response headers:", dict(response.headers))
-                
-                # Save response content for debugging
-                with open('google_response.html', 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-                print("[DEBUG] Saved response content to google_response.html")
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                if not soup.find_all('div', {'class': ['g', 'g-inner']}):
-                    print("[DEBUG] No search result elements found in response")
-                # Try different possible result containers
-                search_results = []
-                for div in soup.find_all(['div', 'article']):
-                    classes = div.get('class', [])
-                    if any(c in ['g', 'g-inner', 'MjjYud', 'Gx5Zad', 'fP1Qef', 'xpd', 'EIaa9b'] for c in classes):
-                        search_results.append(div)
-
-                for i, result in enumerate(search_results[:max_results], 1):
-                    title_elem = result.find(['h3', 'h4'])
-                    link_elem = result.find('a')
-                    snippet_elem = result.find('div', {'class': ['VwiC3b', 'lyLwlc']})
-
-                    if title_elem and link_elem:
-                        results.append({
-                            'position': i,
-                            'keyword': query,
-                            'title': title_elem.text.strip(),
-                            'url': link_elem.get('href', '').split('?q=')[-1].split('&')[0] if '?q=' in link_elem.get('href', '') else link_elem.get('href', ''),
-                            'description': snippet_elem.text.strip() if snippet_elem else ''
-                        })
+            # Sampled, asynchronous and off by default. Captured before the
+            # checks below so block pages and error responses are kept too.
+            self.capture_response(query, response)
+            
+            # Raises ProviderBlocked for 429s and /sorry/ redirects
+            self.check_response(response)
+            
+            soup = BeautifulSoup(response.text, 'html.parser')
+            # Skip the extra tree walk unless someone is actually reading debug output
+            if logger.isEnabledFor(logging.DEBUG) and not soup.find_all('div', {'class': ['g', 'g-inner']}):
+                logger.debug("No search result elements found in response")
+            # Try different possible result containers
+            search_results = []
+            for div in soup.find_all(['div', 'article']):
+                classes = div.get('class', [])
+                if any(c in ['g', 'g-inner', 'MjjYud', 'Gx5Zad', 'fP1Qef', 'xpd', 'EIaa9b'] for c in classes):
+                    search_results.append(div)
+            if not search_results:
+                self.check_block_page(response)
 
-                if results:
-                    break
+            for i, result in enumerate(search_results[:max_results], 1):
+                title_elem = result.find(['h3', 'h4'])
+                link_elem = result.find('a')
+                snippet_elem = result.find('div', {'class': ['VwiC3b', 'lyLwlc']})
 
-            except Exception as e:
-                print(f"Search attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                continue
+                if title_elem and link_elem:
+                    results.append({
+                        'position': i,
+                        'keyword': query,
+                        'title': title_elem.text.strip(),
+                        'url': link_elem.get('href', '').split('?q=')[-1].split('&')[0] if '?q=' in link_elem.get('href', '') else link_elem.get('href', ''),
+                        'description': snippet_elem.text.strip() if snippet_elem else ''
+                    })
+            return results
 
-        return results
+        return self.run_with_retries(query, max_retries, 2, attempt_search)
 
 class DuckDuckGoSearch(SearchProvider):
+    # The HTML endpoint answers bots with a 202 "anomaly" interstitial
+    BLOCK_MARKERS = SearchProvider.BLOCK_MARKERS + ['anomaly-modal', 'bots use duckduckgo too']
+
     def search(self, query, max_results=10, max_retries=3):
-        results = []
-        retry_delay = 3
+        import requests
+        from bs4 import BeautifulSoup
 
-        for attempt in range(max_retries):
-            try:
-                params = {'q': query, 'kl': 'us-en'}
-                response = requests.get(
-                    'https://html.duckduckgo.com/html/',
-                    headers=self.get_headers(),
-                    params=params,
-                    timeout=15
-                )
-                response.raise_for_status()
+        def attempt_search():
+            results = []
+            params = {'q': query, 'kl': 'us-en'}
+            response = requests.get(
+                'https://html.duckduckgo.com/html/',
+                headers=self.get_headers(),
+                params=params,
+                timeout=15
+            )
+            self.capture_response(query, response)
+            self.check_response(response)
 
-                soup = BeautifulSoup(response.text, 'html.parser')
-                search_results = soup.find_all('div', {'class': 'result'})
+            soup = BeautifulSoup(response.text, 'html.parser')
+            search_results = soup.find_all('div', {'class': 'result'})
+            if not search_results:
+                self.check_block_page(response)
 
-                for i, result in enumerate(search_results[:max_results], 1):
-                    title_elem = result.find('a', {'class': 'result__a'})
-                    snippet_elem = result.find('a', {'class': 'result__snippet'})
+            for i, result in enumerate(search_results[:max_results], 1):
+                title_elem = result.find('a', {'class': 'result__a'})
+                snippet_elem = result.find('a', {'class': 'result__snippet'})
 
-                    if title_elem:
-                        results.append({
-                            'position': i,
-                            'keyword': query,
-                            'title': title_elem.text.strip(),
-                            'url': title_elem['href'],
-                            'description': snippet_elem.text.strip() if snippet_elem else ''
-                        })
+                if title_elem:
+                    results.append({
+                        'position': i,
+                        'keyword': query,
+                        'title': title_elem.text.strip(),
+                        'url': title_elem['href'],
+                        'description': snippet_elem.text.strip() if snippet_elem else ''
+                    })
+            return results
 
-                if results:
+        return self.run_with_retries(query, max_retries, 3, attempt_search)
+
+class MultiProviderSearch:
+    # Queries every provider at once, hedges a provider that runs past its own
+    # p95 latency with a second identical request, and merges the rankings by
+    # reciprocal-rank fusion so a URL that several providers rank well wins.
+    # Providers that pace themselves (PACING_DELAY) are never hedged, since a
+    # hedge would double exactly the traffic the pacing exists to limit, and
+    # the straggler grace is stretched by their pacing so they are not cut off
+    # while still sleeping.
+    def __init__(self, providers, hedge_quantile=0.95, default_hedge_after=8.0,
+                 min_latency_samples=5, straggler_grace=3.0, timeout=60.0, rrf_k=60):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.providers = providers
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_after = default_hedge_after
+        self.min_latency_samples = min_latency_samples
+        self.straggler_grace = straggler_grace
+        self.timeout = timeout
+        self.rrf_k = rrf_k
+
+        self._latencies = {self.provider_name(p): deque(maxlen=100) for p in providers}
+        self._hedges = {self.provider_name(p): 0 for p in providers}
+        self._lock = threading.Lock()
+        # Primary plus hedge per provider, with headroom for abandoned stragglers
+        # still finishing from the previous keyword
+        self._executor = ThreadPoolExecutor(max_workers=max(4 * len(providers), 1),
+                                            thread_name_prefix='search')
+
+    @staticmethod
+    def provider_name(provider):
+        return provider.__class__.__name__
+
+    def hedges(self, provider):
+        return not provider.PACING_DELAY[1]
+
+    def straggler_grace_for(self, provider):
+        return self.straggler_grace + provider.PACING_DELAY[1]
+
+    def hedge_after(self, provider):
+        with self._lock:
+            samples = sorted(self._latencies[self.provider_name(provider)])
+        if len(samples) < self.min_latency_samples:
+            return self.default_hedge_after
+        index = min(int(len(samples) * self.hedge_quantile), len(samples) - 1)
+        return samples[index]
+
+    def _timed_search(self, provider, query, max_results):
+        start = time.monotonic()
+        results = provider.search(query, max_results=max_results)
+        with self._lock:
+            self._latencies[self.provider_name(provider)].append(time.monotonic() - start)
+        return results
+
+    def _submit(self, provider, query, max_results):
+        # Run in a copy of the caller's context so log records keep its url/stage
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._timed_search, provider, query, max_results)
+
+    def search(self, query, max_results=10):
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        start = time.monotonic()
+        # future -> provider; hedges map to the same provider as their primary
+        pending = {}
+        hedged = set()
+        results_by_provider = {}
+        first_done_at = None
+
+        for provider in self.providers:
+            future = self._submit(provider, query, max_results)
+            pending[future] = provider
+
+        while pending:
+            now = time.monotonic()
+            if now - start >= self.timeout:
+                break
+            grace_until = None
+            if first_done_at is not None:
+                grace_until = first_done_at + max(self.straggler_grace_for(p) for p in pending.values())
+                if now >= grace_until:
                     break
 
-            except Exception as e:
-                print(f"Search attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                continue
+            # Wake up for the earliest of: a hedge deadline, the grace period or the overall timeout
+            deadlines = [start + self.timeout]
+            if grace_until is not None:
+                deadlines.append(grace_until)
+            for provider in set(pending.values()):
+                if self.hedges(provider) and self.provider_name(provider) not in hedged:
+                    deadlines.append(start + self.hedge_after(provider))
+
+            done, _ = wait(list(pending), timeout=max(min(deadlines) - now, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                name = self.provider_name(provider)
+                if name in results_by_provider:
+                    continue
+                try:
+                    provider_results = future.result()
+                except ProviderUnavailable as e:
+                    logger.info("Skipping %s: %s", name, e)
+                    provider_results = []
+                except Exception as e:
+                    logger.error("Error with %s: %s", name, e)
+                    provider_results = []
+
+                # An empty answer from the primary may still be beaten by its hedge
+                if not provider_results and any(p is provider for p in pending.values()):
+                    continue
+                results_by_provider[name] = provider_results
+                # Drop the other copy of this provider's request; it keeps running but is ignored
+                for other, other_provider in list(pending.items()):
+                    if other_provider is provider:
+                        del pending[other]
+                if provider_results and first_done_at is None:
+                    first_done_at = time.monotonic()
+
+            now = time.monotonic()
+            for provider in set(pending.values()):
+                name = self.provider_name(provider)
+                if not self.hedges(provider) or name in hedged:
+                    continue
+                if now - start >= self.hedge_after(provider):
+                    hedged.add(name)
+                    with self._lock:
+                        self._hedges[name] += 1
+                    logger.info("Hedging slow %s request for: %s", name, query)
+                    future = self._submit(provider, query, max_results)
+                    pending[future] = provider
+
+        for future in pending:
+            future.cancel()
+
+        return self.fuse(results_by_provider, max_results)
+
+    def fuse(self, results_by_provider, max_results=10):
+        # Reciprocal-rank fusion: score(url) = sum over providers of 1 / (k + rank)
+        scores = {}
+        merged = {}
+        for name, results in results_by_provider.items():
+            seen = set()
+            for rank, result in enumerate(results, 1):
+                if not isinstance(result, dict) or 'title' not in result:
+                    continue
+                url = result.get('url', '')
+                if not url or url in seen:
+                    continue
+                seen.add(url)
+                scores[url] = scores.get(url, 0.0) + 1.0 / (self.rrf_k + rank)
+                if url not in merged:
+                    merged[url] = dict(result)
+                    merged[url]['providers'] = []
+                merged[url]['providers'].append(name)
+
+        ranked = sorted(merged, key=lambda url: scores[url], reverse=True)[:max_results]
+        fused = []
+        for position, url in enumerate(ranked, 1):
+            result = merged[url]
+            result['position'] = position
+            result['rrf_score'] = round(scores[url], 6)
+            fused.append(result)
+        return fused
+
+    def metrics(self):
+        # Circuit breaker state plus latency and hedging figures, per provider
+        metrics = {}
+        for provider in self.providers:
+            name = self.provider_name(provider)
+            with self._lock:
+                samples = sorted(self._latencies[name])
+                hedges = self._hedges[name]
+            provider_metrics = provider.health.metrics()
+            provider_metrics['hedged_requests'] = hedges
+            if samples:
+                provider_metrics['latency_p50'] = round(samples[len(samples) // 2], 3)
+                p95_index = min(int(len(samples) * self.hedge_quantile), len(samples) - 1)
+                provider_metrics['latency_p95'] = round(samples[p95_index], 3)
+            metrics[name] = provider_metrics
+        return metrics
 
-        return results
\ No newline at end of file
+    def close(self):
+        # Wake any request sleeping in pacing or backoff so abandoned stragglers
+        # don't hold up interpreter exit, then drop whatever has not started
+        for provider in self.providers:
+            provider.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
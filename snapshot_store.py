@@ -0,0 +1,188 @@
+import os
+import sys
+import gzip
+import hashlib
+import logging
+import argparse
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+logger = logging.getLogger("web_analyzer.snapshots")
+
+class SnapshotStore:
+    # Content-addressed store for the page bodies the analyzers actually saw.
+    # Each body is stored once under the SHA-256 of its UTF-8 bytes, compressed
+    # with zstd when the zstandard package is installed and gzip otherwise, so
+    # a page that is identical across runs or competitors costs one file. Reports
+    # reference snapshots by hash; gc() trims the least recently used entries
+    # once the store grows past max_bytes. "Used" means written or read: put()
+    # and get() both bump the file's mtime, which is what gc() orders by.
+    EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+
+    def __init__(self, directory=None, compression=None, max_bytes=500 * 1024 * 1024, level=None):
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+        if compression is None:
+            compression = 'zstd' if zstandard else 'gzip'
+        if compression not in self.EXTENSIONS:
+            raise ValueError(f"compression must be one of {tuple(self.EXTENSIONS)}, got {compression!r}")
+        if compression == 'zstd' and not zstandard:
+            raise ValueError("zstd compression needs the zstandard package")
+
+        self.directory = directory
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.level = level
+
+    def _path(self, snapshot_hash, compression):
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.directory, snapshot_hash[:2], snapshot_hash + self.EXTENSIONS[compression])
+
+    def _compress(self, data):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level or 10).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    def find(self, snapshot_hash):
+        # A store can hold both formats if the compression setting changed
+        for compression in self.EXTENSIONS:
+            path = self._path(snapshot_hash, compression)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(self, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        snapshot_hash = hashlib.sha256(data).hexdigest()
+
+        existing = self.find(snapshot_hash)
+        if existing:
+            # Already stored: just mark it as recently used for gc()
+            try:
+                os.utime(existing)
+            except OSError:
+                pass
+            return snapshot_hash
+
+        path = self._path(snapshot_hash, self.compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._compress(data))
+        # Concurrent writers of the same page produce identical bytes, so last rename wins harmlessly
+        os.replace(tmp_path, path)
+        return snapshot_hash
+
+    def get(self, snapshot_hash):
+        path = self.find(snapshot_hash)
+        if path is None:
+            raise KeyError(f"No snapshot {snapshot_hash} in {self.directory}")
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if path.endswith(self.EXTENSIONS['zstd']):
+            if not zstandard:
+                raise ValueError(f"Snapshot {snapshot_hash} is zstd-compressed but zstandard is not installed")
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+        else:
+            data = gzip.decompress(raw)
+
+        if hashlib.sha256(data).hexdigest() != snapshot_hash:
+            raise ValueError(f"Snapshot {snapshot_hash} is corrupt")
+        # Mark it as recently used, so a snapshot being re-analysed survives gc()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data.decode('utf-8')
+
+    def entries(self):
+        # (path, size, mtime) for every stored snapshot
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def gc(self, max_bytes=None, keep=()):
+        # Delete least recently used snapshots until the store fits in max_bytes.
+        # Hashes in `keep` (e.g. the ones the current report references) survive.
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        keep = set(keep)
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        freed = 0
+
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= max_bytes:
+                break
+            if os.path.basename(path).split('.')[0] in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            removed += 1
+            # Drop the fan-out directory once its last snapshot is gone
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+        if removed:
+            logger.info("Snapshot gc removed %d snapshots (%.1f MB)", removed, freed / (1024 * 1024))
+        return {'removed': removed, 'freed_bytes': freed, 'total_bytes': total}
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the page snapshot store")
+    parser.add_argument("--dir", help="Snapshot store directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = subparsers.add_parser("show", help="Print a stored page")
+    show_parser.add_argument("hash")
+
+    rerun_parser = subparsers.add_parser("rerun", help="Re-run an analyzer on stored snapshots, offline")
+    rerun_parser.add_argument("analyzer", choices=["keywords", "content_audit", "cta"])
+    rerun_parser.add_argument("hash", help="Snapshot the analyzer parsed (the rendered page for keywords)")
+    rerun_parser.add_argument("--static", help="keywords only: hash of the fetched HTML that JSON-LD came from")
+    rerun_parser.add_argument("--url", default="", help="Page URL, used to resolve relative links in the audit")
+    rerun_parser.add_argument("--full-parse", action="store_true", help="Parse with scripts, styles and SVG paths left in")
+
+    gc_parser = subparsers.add_parser("gc", help="Trim the store to a size budget")
+    gc_parser.add_argument("--max-mb", type=float, default=500, help="Size budget for the store")
+
+    args = parser.parse_args()
+    store = SnapshotStore(directory=args.dir)
+
+    if args.command == "show":
+        sys.stdout.write(store.get(args.hash))
+    elif args.command == "rerun":
+        import json
+        from web_research import WebAnalyzer
+
+        analyzer = WebAnalyzer(use_browser=False, selective_parse=not args.full_parse, snapshot_store=store)
+        result = analyzer.analyze_snapshot(args.analyzer, args.hash, url=args.url, static_hash=args.static)
+        print(json.dumps(result, indent=4))
+    elif args.command == "gc":
+        print(store.gc(max_bytes=int(args.max_mb * 1024 * 1024)))
+
+if __name__ == "__main__":
+    main()
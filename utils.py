@@ -1,27 +1,164 @@
 import os
 import time
 import random
+import atexit
 import logging
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
+import re
 import json
+import copy
+import gzip
+import glob
+import shutil
+import queue
+import threading
+import itertools
+
+logger = logging.getLogger("web_analyzer.utils")
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still single writes, just not cross-process locked
+    fcntl = None
+
+# Per-URL / per-stage context attached to every log record. A ContextVar follows
+# the current thread (and anything run via contextvars.copy_context()), so
+# concurrent workers never see each other's URL.
+_log_context = contextvars.ContextVar('web_analyzer_log_context', default={})
+_log_listener = None
+_stop_logging_registered = False
+
+@contextmanager
+def log_context(**fields):
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _log_context.get()
+        record.url = context.get('url', '-')
+        record.stage = context.get('stage', '-')
+        return True
+
+class RateLimitFilter(logging.Filter):
+    # Lets at most `burst` records per message template through every `interval`
+    # seconds; the next record that gets through reports how many were dropped.
+    # Keyed on the unformatted msg, so "Analyzing keyword: %s" is one template.
+    # WARNING and above are never limited.
+    def __init__(self, burst=5, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.burst:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self._windows[key] = (window_start, count + 1, 0)
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+class StructuredFormatter(logging.Formatter):
+    # One JSON object per line, for shipping logs to something that parses them
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'url': getattr(record, 'url', '-'),
+            'stage': getattr(record, 'stage', '-'),
+            'message': record.getMessage()
+        }
+        # Queued records carry the traceback pre-rendered in exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+def setup_logging(level=logging.INFO, json_format=False, rate_limit_burst=5, rate_limit_interval=10.0):
+    # Records go onto a queue and a background QueueListener does the file and
+    # console writes, so worker threads never block on log I/O.
+    import logging.handlers
+
+    global _log_listener, _stop_logging_registered
+
+    class ContextQueueHandler(logging.handlers.QueueHandler):
+        # The stock prepare() formats the record with this handler's own
+        # formatter, which folds the traceback into msg and drops exc_info,
+        # so the listener's formatters could no longer tell message and
+        # traceback apart. Resolve the args and render the traceback into
+        # exc_text instead, and leave the rest to the listener's formatter.
+        def prepare(self, record):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+            return record
 
-def setup_logging():
     # Create logs directory if it doesn't exist
     logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
     os.makedirs(logs_dir, exist_ok=True)
     
     log_file = os.path.join(logs_dir, "web_analyzer.log")
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
+
+    if json_format:
+        formatter = StructuredFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(url)s %(stage)s] %(message)s')
+
+    file_handler = logging.FileHandler(log_file)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    if _log_listener is not None:
+        _log_listener.stop()
+    _log_listener = logging.handlers.QueueListener(
+        queue.SimpleQueue(), file_handler, stream_handler, respect_handler_level=True
     )
+    queue_handler = ContextQueueHandler(_log_listener.queue)
+    # Context and rate limiting run in the calling thread, before the record is queued
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(RateLimitFilter(rate_limit_burst, rate_limit_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _log_listener.start()
+    if not _stop_logging_registered:
+        atexit.register(stop_logging)
+        _stop_logging_registered = True
     return logging.getLogger("web_analyzer")
 
+def stop_logging():
+    # Flush whatever is still queued; safe to call more than once
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
 def save_json_report(data, prefix="web_analyzer"):
     # Create reports directory if it doesn't exist
     reports_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
@@ -35,6 +172,235 @@ def save_json_report(data, prefix="web_analyzer"):
     
     return filename
 
+class NDJSONReportWriter:
+    # Appends one compact JSON line per report to a shared file. Every append
+    # happens under an exclusive lock on "<path>.lock" so several workers can
+    # write to the same file, and the active file is rotated once it grows past
+    # max_bytes. Rotated segments are optionally gzip-compressed.
+    FSYNC_POLICIES = ('always', 'interval', 'never')
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, compress=True,
+                 fsync='interval', fsync_interval=5.0):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {self.FSYNC_POLICIES}, got {fsync!r}")
+
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = None
+        self._last_fsync = time.monotonic()
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _ensure_current(self):
+        # Another worker may have rotated the file since we opened it, in which
+        # case our descriptor points at the renamed segment, not self.path.
+        if self._fd is None:
+            self._open()
+            return
+        try:
+            on_disk = os.stat(self.path)
+        except FileNotFoundError:
+            self._open()
+            return
+        ours = os.fstat(self._fd)
+        if (on_disk.st_dev, on_disk.st_ino) != (ours.st_dev, ours.st_ino):
+            self._open()
+
+    def _rotate(self):
+        os.fsync(self._fd)
+        base, ext = os.path.splitext(self.path)
+        # Rotation happens under the lock, so these names sort in rotation order
+        timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        counter = 0
+        while True:
+            segment = f"{base}.{timestamp_str}.{os.getpid()}.{counter}{ext}"
+            if not os.path.exists(segment) and not os.path.exists(segment + '.gz'):
+                break
+            counter += 1
+        os.rename(self.path, segment)
+        self._open()
+        return segment
+
+    def write(self, data):
+        line = (json.dumps(data, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+        rotated = None
+
+        if fcntl:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            self._ensure_current()
+            size = os.fstat(self._fd).st_size
+            if size and size + len(line) > self.max_bytes:
+                rotated = self._rotate()
+            # A single write() on an O_APPEND descriptor lands as one unit.
+            os.write(self._fd, line)
+
+            now = time.monotonic()
+            if self.fsync == 'always' or (
+                    self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._fd)
+                self._last_fsync = now
+        finally:
+            if fcntl:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+        # Nobody writes to a rotated segment any more, so compress it outside the lock.
+        if rotated and self.compress:
+            _gzip_file(rotated)
+
+        return self.path
+
+    def close(self):
+        if self._fd is not None:
+            if self.fsync != 'never':
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _gzip_file(path):
+    tmp_path = path + '.gz.tmp'
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, path + '.gz')
+    os.remove(path)
+
+def ndjson_segments(path):
+    # Rotated segments (oldest first) followed by the active file. Segments are
+    # named <base>.<timestamp>.<pid>.<n><ext>[.gz] and ordered by that name:
+    # compression happens after rotation, so mtimes say nothing useful.
+    path = os.path.abspath(path)
+    base, ext = os.path.splitext(path)
+    segment_pattern = re.compile(
+        re.escape(os.path.basename(base)) + r'\.(\d{8}_\d{6}(?:_\d{6})?)\.(\d+)\.(\d+)'
+        + re.escape(ext) + r'(\.gz)?$'
+    )
+    rotated = {}
+    for candidate in glob.glob(glob.escape(base) + '.*'):
+        match = segment_pattern.match(os.path.basename(candidate))
+        if not match:
+            continue
+        timestamp_str, pid, counter, compressed = match.groups()
+        key = (timestamp_str, int(counter), int(pid))
+        # Mid-compression both files exist; the .gz is already complete by then
+        if key not in rotated or compressed:
+            rotated[key] = candidate
+    segments = [rotated[key] for key in sorted(rotated)]
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+def iter_ndjson_reports(path, include_rotated=True):
+    # Streams reports back one line at a time; nothing is held beyond the current record
+    paths = ndjson_segments(path) if include_rotated else [path]
+    for segment in paths:
+        opener = gzip.open if segment.endswith('.gz') else open
+        with opener(segment, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A worker killed mid-write can leave a partial last line
+                    continue
+
+class DebugCapture:
+    # Opt-in, sampled capture of raw responses for debugging scrapers. Writes go
+    # through a queue to a background thread so the caller never blocks on disk,
+    # every capture gets a unique file name so concurrent workers cannot clobber
+    # each other, and the directory is pruned to the newest max_files captures.
+    def __init__(self, directory=None, sample_rate=1.0, max_files=50, max_pending=20):
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_captures")
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._counter = itertools.count()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="debug-capture", daemon=True)
+                self._thread.start()
+
+    def capture(self, label, content, metadata=None):
+        # content and metadata may be callables, so callers only pay for
+        # building them (e.g. decoding a response body) when this one is sampled
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if callable(content):
+            content = content()
+        if callable(metadata):
+            metadata = metadata()
+
+        self._ensure_thread()
+        timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        safe_label = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)[:40]
+        filename = f"{safe_label}_{timestamp_str}_{os.getpid()}_{next(self._counter)}.html"
+        try:
+            self._queue.put_nowait((filename, content, metadata))
+        except queue.Full:
+            # Never stall a query for a debug file
+            self.dropped += 1
+            return None
+        return os.path.join(self.directory, filename)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            filename, content, metadata = item
+            try:
+                with open(os.path.join(self.directory, filename), 'w', encoding='utf-8') as f:
+                    if metadata:
+                        f.write(f"<!-- {json.dumps(metadata, default=str)} -->\n")
+                    f.write(content)
+                self._prune()
+            except OSError as e:
+                logger.warning("Debug capture failed: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        captures = sorted(glob.glob(os.path.join(glob.escape(self.directory), '*.html')), key=os.path.getmtime)
+        for path in captures[:max(len(captures) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
 def random_delay(min_seconds=1, max_seconds=3):
     delay = random.uniform(min_seconds, max_seconds)
     time.sleep(delay)
@@ -1,19 +1,116 @@
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
 import json
+import logging
 from datetime import datetime
 import time
 import re
+import zlib
 from urllib.parse import urljoin
 
-from search_providers import DuckDuckGoSearch
-from utils import save_json_report
+from search_providers import DuckDuckGoSearch, GoogleSearch, MultiProviderSearch
+from utils import save_json_report, log_context
+
+logger = logging.getLogger("web_analyzer.research")
+
+# requests, bs4 and selenium are imported where they are first used so that
+# `main.py --help`, --no-browser runs and short-lived workers don't pay for them.
+
+# Markup none of the analyzers read. Script and style bodies never show up in
+# .text/.stripped_strings and SVG path data carries no text, so emptying them
+# before parsing leaves keyword, audit and CTA output unchanged while the tree
+# skips what is often most of a modern page. Emptied tags stay in place so the
+# text nodes around them are not merged (React emits "Sign<!-- -->Up") and
+# every element keeps its children (.string is None for an <a> holding an SVG
+# title and a path), and JSON-LD scripts are kept whole for keywords_from_soup.
+#
+# The scan steps over whole comments and whole start tags (quoted attribute
+# values included), the way html.parser does, so a "<script>" inside a comment
+# or an attribute value is never mistaken for a real one.
+MARKUP_TOKEN_PATTERN = re.compile(
+    r'<!--.*?-->'
+    r'|<(?P<name>[a-zA-Z][^\s/>]*)(?P<attrs>(?:"[^"]*"|\'[^\']*\'|[^\'">])*)>',
+    re.S
+)
+CLOSING_TAG_PATTERNS = {
+    'script': re.compile(r'</script[^>]*>', re.I),
+    'style': re.compile(r'</style[^>]*>', re.I)
+}
+PATH_CLOSE_PATTERN = re.compile(r'\s*</path\s*>', re.I)
+
+def strip_unused_markup(html):
+    # Jumping straight to the closing tag is much faster than a lazy .*? regex
+    # over bodies that can run to hundreds of kilobytes.
+    parts = []
+    pos = 0   # start of the not-yet-copied input
+    scan = 0  # where to look for the next token
+    while True:
+        match = MARKUP_TOKEN_PATTERN.search(html, scan)
+        if not match:
+            break
+
+        name = match.group('name')
+        if name is None:
+            # Comment: keep an empty one so adjacent text nodes stay separate
+            parts.append(html[pos:match.start()])
+            parts.append('<!---->')
+            pos = scan = match.end()
+            continue
+
+        name = name.lower()
+        attrs = match.group('attrs')
+        self_closing = attrs.rstrip().endswith('/')
+        if name in CLOSING_TAG_PATTERNS and not self_closing:
+            closing = CLOSING_TAG_PATTERNS[name].search(html, match.end())
+            if not closing:
+                break
+            if 'ld+json' not in attrs.lower():
+                # Keep the start tag and the closing tag, drop the body
+                parts.append(html[pos:match.end()])
+                pos = closing.start()
+            scan = closing.end()
+        elif name == 'path':
+            closing = None if self_closing else PATH_CLOSE_PATTERN.match(html, match.end())
+            if self_closing or closing:
+                # Keep the element (and any whitespace inside it), drop the path data
+                parts.append(html[pos:match.start()])
+                parts.append('<path/>' if self_closing else '<path>')
+                pos = scan = match.end()
+            else:
+                # A <path> with children (e.g. a <title>) may carry text
+                scan = match.end()
+        else:
+            scan = match.end()
+
+    parts.append(html[pos:])
+    return ''.join(parts)
+
+SEARCH_PROVIDERS = {
+    'duckduckgo': DuckDuckGoSearch,
+    'google': GoogleSearch
+}
 
 class WebAnalyzer:
-    def __init__(self):
+    def __init__(self, report_writer=None, max_body_bytes=5 * 1024 * 1024,
+                 max_decoded_bytes=20 * 1024 * 1024, selective_parse=True,
+                 search_providers=('duckduckgo', 'google'), debug_capture=None,
+                 use_browser=True, snapshot_store=None):
+        # Optional NDJSONReportWriter; batch runs append to it instead of writing one file per URL
+        self.report_writer = report_writer
+        # Caps for fetch_page: bytes read off the wire and bytes after decompression
+        self.max_body_bytes = max_body_bytes
+        self.max_decoded_bytes = max_decoded_bytes
+        # Strip scripts, styles, comments and SVG paths before building the tree
+        self.selective_parse = selective_parse
+        # False keeps the whole run on plain HTTP; selenium is never imported
+        self.use_browser = use_browser
+        # Optional SnapshotStore; every page body an analyzer parses is kept by hash
+        self.snapshot_store = snapshot_store
+        self.search = MultiProviderSearch([
+            SEARCH_PROVIDERS[name](debug_capture=debug_capture) for name in search_providers
+        ])
         self.data = {
             'primary_keywords': [],
+            'truncated_pages': [],
+            'snapshots': [],
             'top_ranking_sites': [],
             'content_audit': {
                 'top_blogs': [],
@@ -27,13 +124,161 @@ class WebAnalyzer:
             }
         }
         
+    def close(self):
+        # Stops the search worker threads; call once the analyzer is done
+        self.search.close()
+
     def setup_selenium(self):
+        from selenium import webdriver
+
         # Initialize Selenium WebDriver
         options = webdriver.ChromeOptions()
         options.add_argument('--headless')
         return webdriver.Chrome(options=options)
         
+    def save_snapshot(self, url, stage, source, html):
+        if not self.snapshot_store:
+            return None
+        try:
+            snapshot_hash = self.snapshot_store.put(html)
+        except OSError as e:
+            logger.warning("Could not store %s snapshot: %s", source, e)
+            return None
+        self.data['snapshots'].append({
+            'url': url,
+            'stage': stage,
+            'source': source,
+            'hash': snapshot_hash
+        })
+        return snapshot_hash
+
+    def analyze_snapshot(self, analyzer, snapshot_hash, url='', static_hash=None):
+        # Re-run one analyzer on stored page bodies without touching the network
+        soup = self.make_soup(self.snapshot_store.get(snapshot_hash))
+        if analyzer == 'keywords':
+            static_soup = self.make_soup(self.snapshot_store.get(static_hash)) if static_hash else soup
+            return self.keywords_from_soup(static_soup, soup)
+        if analyzer == 'content_audit':
+            return self.audit_from_soup(soup, url)
+        if analyzer == 'cta':
+            return self.cta_from_soup(soup)
+        raise ValueError(f"Unknown analyzer: {analyzer}")
+
+    def render_page(self, url, stage):
+        # Soup of the JavaScript-rendered page, or None when the browser is
+        # disabled or fails so callers fall back to a plain HTTP fetch
+        if not self.use_browser:
+            return None
+
+        driver = None
+        try:
+            driver = self.setup_selenium()
+            driver.get(url)
+            time.sleep(3)  # Wait for JavaScript content
+            html = driver.page_source
+            self.save_snapshot(url, stage, 'rendered', html)
+            return self.make_soup(html)
+        except Exception as e:
+            logger.warning("Selenium failed, falling back to requests: %s", e)
+            return None
+        finally:
+            if driver:
+                try:
+                    driver.quit()
+                except:
+                    pass
+        
+    def make_soup(self, html):
+        from bs4 import BeautifulSoup
+
+        if self.selective_parse:
+            html = strip_unused_markup(html)
+        return BeautifulSoup(html, 'html.parser')
+
+    def fetch_page(self, url, headers, timeout, stage):
+        import requests
+
+        # Stream the body instead of materialising response.text, so a huge page
+        # or a gzip bomb is cut off at the configured caps rather than read whole.
+        headers = dict(headers)
+        headers['Accept-Encoding'] = 'gzip, deflate'
+
+        response = requests.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+
+            # Reject non-HTML before downloading a single body byte
+            if 'text/html' not in response.headers.get('Content-Type', '').lower():
+                raise ValueError("Response is not HTML")
+
+            encoding = response.headers.get('Content-Encoding', '').lower().strip()
+            if encoding == 'gzip':
+                decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif encoding == 'deflate':
+                decoder = zlib.decompressobj()
+            else:
+                decoder = None
+
+            chunks = []
+            body_bytes = 0
+            decoded_bytes = 0
+            truncated_reason = None
+
+            for chunk in response.raw.stream(64 * 1024, decode_content=False):
+                body_bytes += len(chunk)
+                if body_bytes > self.max_body_bytes:
+                    chunk = chunk[:len(chunk) - (body_bytes - self.max_body_bytes)]
+                    body_bytes = self.max_body_bytes
+                    truncated_reason = 'max_body_bytes'
+
+                if decoded_bytes >= self.max_decoded_bytes:
+                    # zlib treats max_length=0 as unlimited, so stop before asking for it
+                    truncated_reason = 'max_decoded_bytes'
+                    break
+
+                if decoder:
+                    try:
+                        data = decoder.decompress(chunk, self.max_decoded_bytes - decoded_bytes)
+                    except zlib.error:
+                        if encoding == 'deflate' and not chunks and not decoded_bytes:
+                            # Some servers send raw deflate without the zlib header
+                            decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                            data = decoder.decompress(chunk, self.max_decoded_bytes - decoded_bytes)
+                        else:
+                            raise
+                    # Leftover input means the decompressed cap was hit
+                    if decoder.unconsumed_tail:
+                        truncated_reason = 'max_decoded_bytes'
+                else:
+                    data = chunk[:self.max_decoded_bytes - decoded_bytes]
+                    if len(data) < len(chunk):
+                        truncated_reason = 'max_decoded_bytes'
+
+                chunks.append(data)
+                decoded_bytes += len(data)
+                if truncated_reason:
+                    break
+
+            html = b''.join(chunks).decode(response.encoding or 'utf-8', errors='replace')
+        finally:
+            response.close()
+
+        if truncated_reason:
+            logger.warning("%s truncated during %s (%s)", url, stage, truncated_reason)
+            self.data['truncated_pages'].append({
+                'url': url,
+                'stage': stage,
+                'reason': truncated_reason,
+                'body_bytes': body_bytes,
+                'decoded_bytes': decoded_bytes
+            })
+
+        self.save_snapshot(url, stage, 'fetched', html)
+        return html
+
     def extract_primary_keywords(self, url):
+        import requests
+
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124 Safari/537.36',
@@ -47,86 +292,16 @@ class WebAnalyzer:
             
             for attempt in range(max_retries):
                 try:
-                    response = requests.get(url, headers=headers, timeout=10)
-                    response.raise_for_status()  # Raise an error for bad status codes
-                    
-                    if 'text/html' not in response.headers.get('Content-Type', '').lower():
-                        raise ValueError("Response is not HTML")
+                    # Raises for bad status codes and non-HTML responses
+                    html = self.fetch_page(url, headers, 10, 'keywords')
                         
-                    # Initialize empty keywords list before extraction
-                    keywords = []
-                    
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    # Extract JSON-LD metadata
-                    json_ld = soup.find_all('script', {'type': 'application/ld+json'})
-                    for script in json_ld:
-                        try:
-                            data = json.loads(script.string)
-                            if isinstance(data, dict):
-                                # Extract keywords from JSON-LD
-                                if 'keywords' in data:
-                                    if isinstance(data['keywords'], list):
-                                        keywords.extend(data['keywords'])
-                                    else:
-                                        keywords.extend(str(data['keywords']).split(','))
-                                # Extract description
-                                if 'description' in data:
-                                    keywords.extend(str(data['description']).split())
-                        except:
-                            continue
-                    
-                    # Use Selenium by default for better JavaScript handling
-                    driver = None
-                    try:
-                        driver = self.setup_selenium()
-                        driver.get(url)
-                        time.sleep(3)  # Wait for JavaScript content
-                        soup = BeautifulSoup(driver.page_source, 'html.parser')
-                    except Exception as e:
-                        print(f"Selenium failed, falling back to requests: {str(e)}")
-                        # If Selenium fails, we'll use the existing soup object
-                        pass
-                    finally:
-                        if driver:
-                            try:
-                                driver.quit()
-                            except:
-                                pass
-                    
-                    # Extract keywords from meta tags
-                    meta_keywords = soup.find('meta', {'name': ['keywords', 'Keywords']})
-                    if meta_keywords:
-                        keywords.extend(meta_keywords.get('content', '').split(','))
+                    static_soup = self.make_soup(html)
                     
-                    # Extract keywords from meta description
-                    meta_desc = soup.find('meta', {'name': ['description', 'Description']})
-                    if meta_desc:
-                        keywords.extend(meta_desc.get('content', '').split())
+                    # Use Selenium by default for better JavaScript handling;
+                    # without it we use the static soup object
+                    rendered_soup = self.render_page(url, 'keywords')
                     
-                    # Extract keywords from title
-                    title = soup.find('title')
-                    if title:
-                        keywords.extend(title.text.split())
-                    
-                    # Extract keywords from headers
-                    for header in soup.find_all(['h1', 'h2', 'h3']):
-                        keywords.extend(header.text.split())
-                    
-                    # Extract keywords from strong/emphasized text
-                    for emphasis in soup.find_all(['strong', 'em', 'b']):
-                        keywords.extend(emphasis.text.split())
-                    
-                    # Clean and store unique keywords
-                    cleaned_keywords = []
-                    for k in keywords:
-                        # Split on non-alphanumeric characters
-                        parts = re.split(r'[^a-zA-Z0-9-]', k.strip().lower())
-                        cleaned_keywords.extend([p for p in parts if p and len(p) > 2])
-                    
-                    # Remove duplicates and common words
-                    cleaned_keywords = list(set(cleaned_keywords))
-                    cleaned_keywords = [k for k in cleaned_keywords if len(k) > 2 and not k.isnumeric()]
+                    cleaned_keywords = self.keywords_from_soup(static_soup, rendered_soup)
                     
                     self.data['primary_keywords'] = cleaned_keywords
                     return cleaned_keywords
@@ -139,59 +314,87 @@ class WebAnalyzer:
                     
             raise last_error if last_error else ValueError("Failed to extract keywords after all retries")
         except Exception as e:
-            error_msg = "Error extracting keywords: " + str(e)
-            print(error_msg)
+            logger.error("Error extracting keywords: %s", e)
             return []
             
+    def keywords_from_soup(self, soup, rendered_soup=None):
+        # JSON-LD comes from the static HTML; everything else prefers the rendered page
+        keywords = []
+        
+        # Extract JSON-LD metadata
+        json_ld = soup.find_all('script', {'type': 'application/ld+json'})
+        for script in json_ld:
+            try:
+                data = json.loads(script.string)
+                if isinstance(data, dict):
+                    # Extract keywords from JSON-LD
+                    if 'keywords' in data:
+                        if isinstance(data['keywords'], list):
+                            keywords.extend(data['keywords'])
+                        else:
+                            keywords.extend(str(data['keywords']).split(','))
+                    # Extract description
+                    if 'description' in data:
+                        keywords.extend(str(data['description']).split())
+            except:
+                continue
+        
+        if rendered_soup is not None:
+            soup = rendered_soup
+        
+        # Extract keywords from meta tags
+        meta_keywords = soup.find('meta', {'name': ['keywords', 'Keywords']})
+        if meta_keywords:
+            keywords.extend(meta_keywords.get('content', '').split(','))
+        
+        # Extract keywords from meta description
+        meta_desc = soup.find('meta', {'name': ['description', 'Description']})
+        if meta_desc:
+            keywords.extend(meta_desc.get('content', '').split())
+        
+        # Extract keywords from title
+        title = soup.find('title')
+        if title:
+            keywords.extend(title.text.split())
+        
+        # Extract keywords from headers
+        for header in soup.find_all(['h1', 'h2', 'h3']):
+            keywords.extend(header.text.split())
+        
+        # Extract keywords from strong/emphasized text
+        for emphasis in soup.find_all(['strong', 'em', 'b']):
+            keywords.extend(emphasis.text.split())
+        
+        # Clean and store unique keywords
+        cleaned_keywords = []
+        for k in keywords:
+            # Split on non-alphanumeric characters
+            parts = re.split(r'[^a-zA-Z0-9-]', k.strip().lower())
+            cleaned_keywords.extend([p for p in parts if p and len(p) > 2])
+        
+        # Remove duplicates and common words
+        cleaned_keywords = list(set(cleaned_keywords))
+        cleaned_keywords = [k for k in cleaned_keywords if len(k) > 2 and not k.isnumeric()]
+        return cleaned_keywords
+
     def analyze_search_performance(self, keyword):
        
         try:
-            # Using only DuckDuckGo as Google search is temporarily disabled (see SEARCH_LIMITATIONS.md)
-            providers = [DuckDuckGoSearch()]
-            all_results = []
-            successful_provider = None
-            
-            for provider in providers:
-                # Always try all providers to get comprehensive results
-                    
-                try:
-                    print(f"Trying search with {provider.__class__.__name__} for keyword: {keyword}")
-                    provider_results = provider.search(keyword)
-                    
-                    if provider_results and isinstance(provider_results, list):
-                        # Validate search results
-                        valid_results = []
-                        for result in provider_results:
-                            if isinstance(result, dict) and 'url' in result and 'title' in result:
-                                valid_results.append(result)
-                        
-                        if valid_results:
-                            all_results.extend(valid_results)
-                            print(f"Found {len(valid_results)} valid results with {provider.__class__.__name__}")
-                            successful_provider = provider.__class__.__name__
-                        else:
-                            print(f"No valid results from {provider.__class__.__name__}, trying next provider...")
-                            
-                    else:
-                        print(f"No results returned from {provider.__class__.__name__}, trying next provider...")
-                        
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    print(f"Error with {provider.__class__.__name__}: {str(e)}")
-                    continue
+            # All enabled providers run concurrently and their rankings are fused
+            logger.debug("Searching %d providers for keyword: %s", len(self.search.providers), keyword)
+            all_results = self.search.search(keyword)
             
             # Always process results even if limited
             if all_results:
-                print(f"Found {len(all_results)} total results across all providers")
-                # Sort by relevance and deduplicate results
+                logger.info("Found %d fused results for keyword: %s", len(all_results), keyword)
+                # Sort by fused rank and deduplicate results
                 unique_results = {}
                 for result in all_results:
                     url = result.get('url', '')
                     if url and url not in unique_results:
                         unique_results[url] = result
                 
-                # Get top 10 most relevant results
+                # Get top 10 results by fused rank
                 top_sites = sorted(unique_results.values(), key=lambda x: x.get('position', 999))[:10]
                 
                 if not self.data['top_ranking_sites']:
@@ -205,293 +408,170 @@ class WebAnalyzer:
                 
                 if new_sites:
                     self.data['top_ranking_sites'].extend(new_sites)
-                    print(f"Added {len(new_sites)} new sites to top ranking sites")
+                    logger.info("Added %d new sites to top ranking sites", len(new_sites))
                     
                 return new_sites
             
             return []
         except Exception as e:
-            error_msg = "Error analyzing search performance: " + str(e)
-            print(error_msg)
+            logger.error("Error analyzing search performance: %s", e)
             return []
             
     def perform_content_audit(self, url):
         # Using web scraping as alternative to Ahrefs
         try:
-            driver = None
-            try:
-                # Use Selenium to handle JavaScript content
-                driver = self.setup_selenium()
-                driver.get(url)
-                time.sleep(3)  # Wait for JavaScript content
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-            except Exception as e:
-                print(f"Selenium failed, falling back to requests: {str(e)}")
+            # Use Selenium to handle JavaScript content
+            soup = self.render_page(url, 'content_audit')
+            if soup is None:
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124',
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                     'Accept-Language': 'en-US,en;q=0.5',
                     'Cache-Control': 'no-cache'
                 }
-                response = requests.get(url, headers=headers, timeout=15)
-                soup = BeautifulSoup(response.text, 'html.parser')
-            finally:
-                if driver:
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-            
-            # Extract blog posts and content
-            blog_posts = []
-            
-            # Look for content in various common content containers
-            common_content_terms = ['post', 'blog', 'article', 'content', 'entry', 'main', 'page', 'feature']
-            content_containers = []
+                html = self.fetch_page(url, headers, 15, 'content_audit')
+                soup = self.make_soup(html)
             
-            # First look for article elements
-            content_containers.extend(soup.find_all('article'))
+            return self.audit_from_soup(soup, url)
+        except Exception as e:
+            logger.error("Error performing content audit: %s", e)
+            return {}
             
-            # Then look for containers with content-related classes
-            content_containers.extend(
-                soup.find_all(
-                    ['div', 'section', 'main'], 
-                    class_=lambda x: x and any(term in str(x).lower() for term in common_content_terms)
-                )
+    def audit_from_soup(self, soup, url):
+        # Extract blog posts and content
+        blog_posts = []
+        
+        # Look for content in various common content containers
+        common_content_terms = ['post', 'blog', 'article', 'content', 'entry', 'main', 'page', 'feature']
+        content_containers = []
+        
+        # First look for article elements
+        content_containers.extend(soup.find_all('article'))
+        
+        # Then look for containers with content-related classes
+        content_containers.extend(
+            soup.find_all(
+                ['div', 'section', 'main'], 
+                class_=lambda x: x and any(term in str(x).lower() for term in common_content_terms)
             )
-            
-            # Also look for rich content areas
-            content_containers.extend(soup.find_all(['div', 'section'], attrs={
-                'role': ['main', 'article', 'contentinfo']
-            }))
-            
-            for container in content_containers:
-                # Look for titles in headers or strong text
-                title_elem = container.find(['h1', 'h2', 'h3', 'strong'])
-                if title_elem:
-                    # Find the closest link to the title
-                    link_elem = container.find('a')
-                    url_path = ''
-                    if link_elem and link_elem.get('href'):
-                        url_path = link_elem['href']
-                        if not url_path.startswith('http'):
-                            url_path = urljoin(url, url_path)
-                    
-                    # Get preview text if available
-                    preview = container.find(['p', 'div'], class_=lambda x: x and any(term in str(x).lower() for term in ['excerpt', 'summary', 'preview']))
-                    preview_text = preview.text.strip() if preview else ''
-                    
-                    blog_posts.append({
-                        'title': title_elem.text.strip(),
-                        'url': url_path,
-                        'preview': preview_text[:200] + '...' if preview_text else ''
-                    })
-            
-            # Get estimated metrics based on content volume and structure
-            content_sections = len(soup.find_all(['section', 'article', 'main']))
-            internal_links = len(soup.find_all('a', href=lambda x: x and not x.startswith('http')))
-            external_links = len(soup.find_all('a', href=lambda x: x and x.startswith('http')))
-            
-            if not soup or not str(soup):
-                raise ValueError("Invalid or empty page content")
+        )
+        
+        # Also look for rich content areas
+        content_containers.extend(soup.find_all(['div', 'section'], attrs={
+            'role': ['main', 'article', 'contentinfo']
+        }))
+        
+        for container in content_containers:
+            # Look for titles in headers or strong text
+            title_elem = container.find(['h1', 'h2', 'h3', 'strong'])
+            if title_elem:
+                # Find the closest link to the title
+                link_elem = container.find('a')
+                url_path = ''
+                if link_elem and link_elem.get('href'):
+                    url_path = link_elem['href']
+                    if not url_path.startswith('http'):
+                        url_path = urljoin(url, url_path)
                 
-            # Estimate backlink data based on external references and site structure
-            backlink_estimate = {
-                'total_backlinks': str(int(external_links * 1.5)) + '+',
-                'referring_domains': str(int(external_links * 0.7)) + '+',
-                'domain_authority': str(min(max(int(content_sections * 0.8 + external_links * 0.2), 20), 90))
-            }
-            
-            traffic_metrics = {
-                'estimated_monthly_visitors': '50000-100000' if content_sections > 5 else '10000-50000',
-                'page_views': str(content_sections * 1000) + '+',
-                'content_sections': content_sections,
-                'internal_links': internal_links
-            }
-            
-            # Analyze content structure with validation
-            has_blog = bool(blog_posts)
-            has_products = bool(soup.find_all('div', class_=lambda x: x and 'product' in str(x).lower()))
-            has_pricing = bool(soup.find_all(['section', 'div'], class_=lambda x: x and 'pricing' in str(x).lower()))
-            
-            # Validate content metrics
-            if content_sections == 0 and (internal_links > 0 or external_links > 0):
-                # Adjust content sections if we found links but missed sections
-                content_sections = max(int((internal_links + external_links) / 5), 1)
-            
-            content_structure = {
-                'has_blog': has_blog,
-                'has_products': has_products,
-                'has_pricing': has_pricing,
-                'content_sections': content_sections
-            }
-            
-            # Create and validate audit data
-            audit_data = {
-                'top_blogs': blog_posts[:10] if blog_posts else [],
-                'traffic_metrics': traffic_metrics,
-                'content_structure': content_structure,
-                'backlink_profile': backlink_estimate
-            }
-            
-            # Ensure we have some valid data
-            if not blog_posts and not content_structure.get('content_sections') and not external_links:
-                print("Warning: Limited content found in audit")
-            
-            # Store data and print warnings if needed
-            if not blog_posts and content_sections == 0:
-                print("Warning: No blog posts or content sections found")
-            if internal_links == 0 and external_links == 0:
-                print("Warning: No links found on page")
-            # Always continue with what we have
+                # Get preview text if available
+                preview = container.find(['p', 'div'], class_=lambda x: x and any(term in str(x).lower() for term in ['excerpt', 'summary', 'preview']))
+                preview_text = preview.text.strip() if preview else ''
                 
-            # Always store what we found
-                self.data['content_audit'] = audit_data
-                # Ensure minimal data structure
-                if 'traffic_metrics' not in self.data['content_audit']:
-                    self.data['content_audit']['traffic_metrics'] = {}
-                if 'content_structure' not in self.data['content_audit']:
-                    self.data['content_audit']['content_structure'] = {}
-            return audit_data
-        except Exception as e:
-            error_msg = "Error performing content audit: " + str(e)
-            print(error_msg)
-            return {}
-            
+                blog_posts.append({
+                    'title': title_elem.text.strip(),
+                    'url': url_path,
+                    'preview': preview_text[:200] + '...' if preview_text else ''
+                })
+        
+        # Get estimated metrics based on content volume and structure
+        content_sections = len(soup.find_all(['section', 'article', 'main']))
+        internal_links = len(soup.find_all('a', href=lambda x: x and not x.startswith('http')))
+        external_links = len(soup.find_all('a', href=lambda x: x and x.startswith('http')))
+        
+        if not soup or not str(soup):
+            raise ValueError("Invalid or empty page content")
+            
+        # Estimate backlink data based on external references and site structure
+        backlink_estimate = {
+            'total_backlinks': str(int(external_links * 1.5)) + '+',
+            'referring_domains': str(int(external_links * 0.7)) + '+',
+            'domain_authority': str(min(max(int(content_sections * 0.8 + external_links * 0.2), 20), 90))
+        }
+        
+        traffic_metrics = {
+            'estimated_monthly_visitors': '50000-100000' if content_sections > 5 else '10000-50000',
+            'page_views': str(content_sections * 1000) + '+',
+            'content_sections': content_sections,
+            'internal_links': internal_links
+        }
+        
+        # Analyze content structure with validation
+        has_blog = bool(blog_posts)
+        has_products = bool(soup.find_all('div', class_=lambda x: x and 'product' in str(x).lower()))
+        has_pricing = bool(soup.find_all(['section', 'div'], class_=lambda x: x and 'pricing' in str(x).lower()))
+        
+        # Validate content metrics
+        if content_sections == 0 and (internal_links > 0 or external_links > 0):
+            # Adjust content sections if we found links but missed sections
+            content_sections = max(int((internal_links + external_links) / 5), 1)
+        
+        content_structure = {
+            'has_blog': has_blog,
+            'has_products': has_products,
+            'has_pricing': has_pricing,
+            'content_sections': content_sections
+        }
+        
+        # Create and validate audit data
+        audit_data = {
+            'top_blogs': blog_posts[:10] if blog_posts else [],
+            'traffic_metrics': traffic_metrics,
+            'content_structure': content_structure,
+            'backlink_profile': backlink_estimate
+        }
+        
+        # Ensure we have some valid data
+        if not blog_posts and not content_structure.get('content_sections') and not external_links:
+            logger.warning("Limited content found in audit")
+        
+        # Store data and print warnings if needed
+        if not blog_posts and content_sections == 0:
+            logger.warning("No blog posts or content sections found")
+        if internal_links == 0 and external_links == 0:
+            logger.warning("No links found on page")
+        # Always continue with what we have
+            
+        # Always store what we found
+            self.data['content_audit'] = audit_data
+            # Ensure minimal data structure
+            if 'traffic_metrics' not in self.data['content_audit']:
+                self.data['content_audit']['traffic_metrics'] = {}
+            if 'content_structure' not in self.data['content_audit']:
+                self.data['content_audit']['content_structure'] = {}
+        return audit_data
+
     def analyze_cta_strategy(self, url):
         # Analyze call-to-action strategy on the website
         try:
-            driver = None
-            try:
-                # Use Selenium to handle JavaScript content
-                driver = self.setup_selenium()
-                driver.get(url)
-                time.sleep(3)  # Wait for JavaScript content
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-            except Exception as e:
-                print(f"Selenium failed, falling back to requests: {str(e)}")
+            # Use Selenium to handle JavaScript content
+            soup = self.render_page(url, 'cta')
+            if soup is None:
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124',
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                     'Accept-Language': 'en-US,en;q=0.5',
                     'Cache-Control': 'no-cache'
                 }
-                response = requests.get(url, headers=headers, timeout=15)
-                soup = BeautifulSoup(response.text, 'html.parser')
-            finally:
-                if driver:
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-            
-            cta_data = []
-            
-            # Find CTAs based on common patterns
-            common_cta_terms = [
-                'cta', 'btn', 'button', 'signup', 'sign-up', 'register', 
-                'try', 'start', 'get', 'download', 'install', 'action',
-                'primary', 'secondary', 'hero', 'submit'
-            ]
-            
-            # Find elements by class
-            cta_elements = soup.find_all(
-                ['a', 'button', 'input', 'div', 'span'],
-                class_=lambda x: x and any(term in str(x).lower() for term in common_cta_terms)
-            )
-            
-            # Find elements by role
-            cta_elements.extend(soup.find_all(attrs={'role': ['button', 'link']}))
-            
-            # Find elements by common CTA attributes
-            cta_elements.extend(soup.find_all(attrs={
-                'type': ['submit', 'button'],
-                'data-action': True,
-                'data-track': True
-            }))
-            
-            # Look for elements with typical CTA text patterns
-            cta_pattern = re.compile(r'(Sign Up|Get Started|Try Now|Learn More|Contact Us|Buy Now)', re.I)
-            
-            # Using string instead of text (fixing deprecation warning)
-            for element in soup.find_all(['a', 'button', 'input', 'div', 'span']):
-                if element.string and cta_pattern.search(element.string):
-                    cta_elements.append(element)
-            
-            seen_texts = set()
-            for cta in cta_elements:
-                # Get text and clean it
-                if isinstance(cta, str):
-                    cta_text = cta.strip()
-                    element = cta.parent
-                else:
-                    # Handle both direct text and nested text
-                    cta_text = ' '.join(text.strip() for text in cta.stripped_strings)
-                    element = cta
-                
-                if not cta_text or cta_text.lower() in seen_texts:
-                    continue
-                    
-                seen_texts.add(cta_text.lower())
-                
-                # Find placement
-                parent = element.find_parent(['header', 'nav', 'main', 'footer', 'section', 'div'])
-                placement = 'body'
-                if parent:
-                    if parent.name == 'header' or parent.get('id', '').lower() == 'header':
-                        placement = 'header'
-                    elif parent.name == 'footer' or parent.get('id', '').lower() == 'footer':
-                        placement = 'footer'
-                    elif parent.name == 'nav':
-                        placement = 'navigation'
-                    elif parent.name == 'main':
-                        placement = 'main_content'
-                
-                # Determine type
-                cta_type = 'generic'
-                text_lower = cta_text.lower()
-                if any(term in text_lower for term in ['sign', 'register', 'join']):
-                    cta_type = 'signup'
-                elif any(term in text_lower for term in ['buy', 'purchase', 'order']):
-                    cta_type = 'purchase'
-                elif any(term in text_lower for term in ['learn', 'read', 'more']):
-                    cta_type = 'learn_more'
-                elif any(term in text_lower for term in ['contact', 'support']):
-                    cta_type = 'contact'
-                elif any(term in text_lower for term in ['try', 'demo', 'free']):
-                    cta_type = 'trial'
-                
-                cta_data.append({
-                    'text': cta_text,
-                    'type': cta_type,
-                    'placement': placement
-                })
-            
-            # Calculate CTA statistics
-            if cta_data:
-                type_counts = {}
-                for cta in cta_data:
-                    type_counts[cta['type']] = type_counts.get(cta['type'], 0) + 1
-                
-                primary_cta_type = max(type_counts.items(), key=lambda x: x[1])[0] if type_counts else None
-            else:
-                primary_cta_type = None
+                html = self.fetch_page(url, headers, 15, 'cta')
+                soup = self.make_soup(html)
             
-            # Create CTA analysis
-            cta_analysis = {
-                'total_ctas': len(cta_data),
-                'cta_types': list(set(cta['type'] for cta in cta_data)),
-                'cta_placements': list(set(cta['placement'] for cta in cta_data)),
-                'primary_cta_type': primary_cta_type,
-                'ctas': cta_data
-            }
+            cta_analysis = self.cta_from_soup(soup)
             
             self.data['cta_analysis'] = cta_analysis
             return cta_analysis
             
         except Exception as e:
-            error_msg = f"Error analyzing CTA strategy: {str(e)}"
-            print(error_msg)
+            logger.error("Error analyzing CTA strategy: %s", e)
             return {
                 'total_ctas': 0,
                 'cta_types': [],
@@ -500,10 +580,177 @@ class WebAnalyzer:
                 'ctas': []
             }
             
+    def cta_from_soup(self, soup):
+        cta_data = []
+        
+        # Find CTAs based on common patterns
+        common_cta_terms = [
+            'cta', 'btn', 'button', 'signup', 'sign-up', 'register', 
+            'try', 'start', 'get', 'download', 'install', 'action',
+            'primary', 'secondary', 'hero', 'submit'
+        ]
+        
+        # Find elements by class
+        cta_elements = soup.find_all(
+            ['a', 'button', 'input', 'div', 'span'],
+            class_=lambda x: x and any(term in str(x).lower() for term in common_cta_terms)
+        )
+        
+        # Find elements by role
+        cta_elements.extend(soup.find_all(attrs={'role': ['button', 'link']}))
+        
+        # Find elements by common CTA attributes
+        cta_elements.extend(soup.find_all(attrs={
+            'type': ['submit', 'button'],
+            'data-action': True,
+            'data-track': True
+        }))
+        
+        # Look for elements with typical CTA text patterns
+        cta_pattern = re.compile(r'(Sign Up|Get Started|Try Now|Learn More|Contact Us|Buy Now)', re.I)
+        
+        # Using string instead of text (fixing deprecation warning)
+        for element in soup.find_all(['a', 'button', 'input', 'div', 'span']):
+            if element.string and cta_pattern.search(element.string):
+                cta_elements.append(element)
+        
+        seen_texts = set()
+        for cta in cta_elements:
+            # Get text and clean it
+            if isinstance(cta, str):
+                cta_text = cta.strip()
+                element = cta.parent
+            else:
+                # Handle both direct text and nested text
+                cta_text = ' '.join(text.strip() for text in cta.stripped_strings)
+                element = cta
+            
+            if not cta_text or cta_text.lower() in seen_texts:
+                continue
+                
+            seen_texts.add(cta_text.lower())
+            
+            # Find placement
+            parent = element.find_parent(['header', 'nav', 'main', 'footer', 'section', 'div'])
+            placement = 'body'
+            if parent:
+                if parent.name == 'header' or parent.get('id', '').lower() == 'header':
+                    placement = 'header'
+                elif parent.name == 'footer' or parent.get('id', '').lower() == 'footer':
+                    placement = 'footer'
+                elif parent.name == 'nav':
+                    placement = 'navigation'
+                elif parent.name == 'main':
+                    placement = 'main_content'
+            
+            # Determine type
+            cta_type = 'generic'
+            text_lower = cta_text.lower()
+            if any(term in text_lower for term in ['sign', 'register', 'join']):
+                cta_type = 'signup'
+            elif any(term in text_lower for term in ['buy', 'purchase', 'order']):
+                cta_type = 'purchase'
+            elif any(term in text_lower for term in ['learn', 'read', 'more']):
+                cta_type = 'learn_more'
+            elif any(term in text_lower for term in ['contact', 'support']):
+                cta_type = 'contact'
+            elif any(term in text_lower for term in ['try', 'demo', 'free']):
+                cta_type = 'trial'
+            
+            cta_data.append({
+                'text': cta_text,
+                'type': cta_type,
+                'placement': placement
+            })
+        
+        # Calculate CTA statistics
+        if cta_data:
+            type_counts = {}
+            for cta in cta_data:
+                type_counts[cta['type']] = type_counts.get(cta['type'], 0) + 1
+            
+            primary_cta_type = max(type_counts.items(), key=lambda x: x[1])[0] if type_counts else None
+        else:
+            primary_cta_type = None
+        
+        # Create CTA analysis
+        cta_analysis = {
+            'total_ctas': len(cta_data),
+            'cta_types': list(set(cta['type'] for cta in cta_data)),
+            'cta_placements': list(set(cta['placement'] for cta in cta_data)),
+            'primary_cta_type': primary_cta_type,
+            'ctas': cta_data
+        }
+        return cta_analysis
+
+    def run_stages(self, web_url):
+        # Every record logged below carries web_url plus the current stage
+        try:
+            logger.info("Starting analysis")
+            
+            # Extract keywords
+            with log_context(stage='keywords'):
+                logger.info("Extracting keywords...")
+                keywords = self.extract_primary_keywords(web_url)
+                if not keywords:
+                    logger.warning("No keywords found")
+                    keywords = []  # Ensure we have a list
+            
+            # Analyze search performance
+            with log_context(stage='search'):
+                logger.info("Analyzing search performance...")
+                top_ranking_sites = []
+                if keywords:
+                    # Filter and prioritize keywords
+                    common_words = {'with', 'and', 'the', 'for', 'our', 'your', 'this', 'that'}
+                    analysis_keywords = [k for k in keywords if len(k) > 3 and k not in common_words]
+                    # Sort by length and frequency
+                    keyword_freq = {}
+                    for k in analysis_keywords:
+                        keyword_freq[k] = keywords.count(k)
+                    analysis_keywords = sorted(analysis_keywords, key=lambda k: (len(k), keyword_freq[k]), reverse=True)[:15]
+                    
+                    # Process keywords in batches to avoid rate limiting
+                    for i in range(0, len(analysis_keywords), 3):
+                        batch = analysis_keywords[i:i+3]
+                        for keyword in batch:
+                            # Rate-limited per template by the logging setup
+                            logger.info("Analyzing keyword: %s", keyword)
+                            results = self.analyze_search_performance(keyword)
+                            if results:
+                                top_ranking_sites.extend(results)
+                            time.sleep(1)  # Short delay between keywords
+                        time.sleep(3)  # Longer delay between batches
+                
+                if top_ranking_sites:
+                    # Update instead of overwrite
+                    existing_urls = {site['url'] for site in self.data['top_ranking_sites']}
+                    new_sites = [site for site in top_ranking_sites if site['url'] not in existing_urls]
+                    self.data['top_ranking_sites'].extend(new_sites)
+            
+            # Perform content audit
+            with log_context(stage='content_audit'):
+                logger.info("Performing content audit...")
+                content_data = self.perform_content_audit(web_url)
+                if content_data:
+                    self.data['content_audit'].update(content_data)
+            
+            # Analyze CTA strategy
+            with log_context(stage='cta'):
+                logger.info("Analyzing CTA strategy...")
+                cta_data = self.analyze_cta_strategy(web_url)
+                if cta_data:
+                    self.data['cta_analysis'].update(cta_data)
+                
+        except Exception as e:
+            logger.exception("Error during analysis: %s", e)
+
     def generate_report(self, web_url):
         # Initialize data structure with defaults
         self.data = {
             'primary_keywords': [],
+            'truncated_pages': [],
+            'snapshots': [],
             'top_ranking_sites': [],
             'content_audit': {
                 'top_blogs': [],
@@ -523,60 +770,13 @@ class WebAnalyzer:
             }
         }
         
-        try:
-            print("Starting analysis for:", web_url)
-            
-            # Extract keywords
-            print("Extracting keywords...")
-            keywords = self.extract_primary_keywords(web_url)
-            if not keywords:
-                print("Warning: No keywords found")
-                keywords = []  # Ensure we have a list
-            
-            # Analyze search performance
-            print("Analyzing search performance...")
-            top_ranking_sites = []
-            if keywords:
-                # Filter and prioritize keywords
-                common_words = {'with', 'and', 'the', 'for', 'our', 'your', 'this', 'that'}
-                analysis_keywords = [k for k in keywords if len(k) > 3 and k not in common_words]
-                # Sort by length and frequency
-                keyword_freq = {}
-                for k in analysis_keywords:
-                    keyword_freq[k] = keywords.count(k)
-                analysis_keywords = sorted(analysis_keywords, key=lambda k: (len(k), keyword_freq[k]), reverse=True)[:15]
-                
-                # Process keywords in batches to avoid rate limiting
-                for i in range(0, len(analysis_keywords), 3):
-                    batch = analysis_keywords[i:i+3]
-                    for keyword in batch:
-                        print(f"  Analyzing keyword: {keyword}")
-                        results = self.analyze_search_performance(keyword)
-                        if results:
-                            top_ranking_sites.extend(results)
-                        time.sleep(1)  # Short delay between keywords
-                    time.sleep(3)  # Longer delay between batches
-            
-            if top_ranking_sites:
-                # Update instead of overwrite
-                existing_urls = {site['url'] for site in self.data['top_ranking_sites']}
-                new_sites = [site for site in top_ranking_sites if site['url'] not in existing_urls]
-                self.data['top_ranking_sites'].extend(new_sites)
-            
-            # Perform content audit
-            print("Performing content audit...")
-            content_data = self.perform_content_audit(web_url)
-            if content_data:
-                self.data['content_audit'].update(content_data)
-            
-            # Analyze CTA strategy
-            print("Analyzing CTA strategy...")
-            cta_data = self.analyze_cta_strategy(web_url)
-            if cta_data:
-                self.data['cta_analysis'].update(cta_data)
-                
-        except Exception as e:
-            print("Error during analysis:", str(e))
+        with log_context(url=web_url):
+            self.run_stages(web_url)
+        
+        # Record how the search providers behaved during this run
+        self.data['run_metrics'] = {
+            'search_providers': self.search.metrics()
+        }
         
         # Create report data
         report = {
@@ -586,7 +786,10 @@ class WebAnalyzer:
         }
         
         # Save report to JSON file using the utility function
-        filename = save_json_report(report, "web_analyzer")
-        print(f"Report saved to: {filename}")
+        if self.report_writer:
+            filename = self.report_writer.write(report)
+        else:
+            filename = save_json_report(report, "web_analyzer")
+        logger.info("Report saved to: %s", filename)
             
         return report